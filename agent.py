@@ -1,9 +1,22 @@
+import io
 import os
+import re
+import json
+import codecs
 import shutil
+import fnmatch
+import hashlib
 import zipfile
+import threading
+from collections import OrderedDict, deque
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
 from dotenv import load_dotenv
 
+import content_index
+from llm_budget import llm_slot
+
 # Load environment variables
 load_dotenv()
 HF_TOKEN = os.getenv('HF_TOKEN')
@@ -11,13 +24,54 @@ MODEL_ID = os.getenv('MODEL_ID')
 
 DESKTOP = os.path.join(os.path.expanduser('~'), 'Desktop')
 
+# "find files containing 'invoice 2024'", "search for invoice"
+CONTENT_SEARCH_RE = (
+    r'(?:find (?:all )?(?:files? )?containing|search(?: for)?)\s+(.+)'
+)
+# Archive commands, shared by the CLI and the web app
+ARCHIVE_LIST_RE = r'list (?:the )?(?:contents of |members of )?(\S+\.zip)$'
+ARCHIVE_GREP_RE = r'grep\s+"(.+?)"\s+in\s+(\S+\.zip)$'
+ARCHIVE_EXTRACT_RE = (
+    r'(?:extract|unzip)\s+(?:(.+?)\s+from\s+)?(\S+\.zip)(?:\s+to\s+(.+))?$'
+)
+# "summarize all .txt files in Reports and save to Reports/summaries",
+# "summarize all Reports/*.txt"
+BATCH_SUMMARIZE_RE = (
+    r'summarize all (?:(\*|\.?\w+) )?files in (\S+)'
+    r'(?: and save to (\S+))?$'
+)
+BATCH_GLOB_RE = r'summarize all (\S*[*?]\S*)(?: and save to (\S+))?$'
+ARCHIVE_SUMMARIZE_RE = (
+    r'summarize(?: the content of)? ([^ ]+) from ([^ ]+\.zip)'
+    r'(?: and save to ([^ ]+))?$'
+)
+
 
 def print_banner():
     print("\n🤖 Byte Agents Client (Python)")
     print("Type your natural language file commands. Type 'exit' to quit.\n")
 
 
-def search_files(query):
+def list_entries(root, recursive=False):
+    """Return ``os.DirEntry`` objects under ``root`` (top level by default).
+
+    ``os.scandir`` caches file type (and on some platforms ``stat``) data,
+    so callers can filter and size entries without extra system calls.
+    """
+    entries = []
+    with os.scandir(root) as it:
+        for entry in it:
+            entries.append(entry)
+            if recursive and entry.is_dir(follow_symlinks=False):
+                try:
+                    entries.extend(list_entries(entry.path, recursive))
+                except OSError as e:
+                    print(f"[ERROR] Could not list {entry.path}: {e}")
+    return entries
+
+
+def search_files(query, root=None):
+    root = root or DESKTOP
     results = []
     query = query.lower()
     known_exts = [
@@ -26,7 +80,7 @@ def search_files(query):
     ]
     # Only search the top-level of Desktop
     try:
-        files = os.listdir(DESKTOP)
+        files = [entry.name for entry in list_entries(root)]
     except Exception as e:
         print(f"[ERROR] Could not list Desktop: {e}")
         return results
@@ -35,20 +89,160 @@ def search_files(query):
             clean_file = file.strip().lower()
             ext_match = clean_file.endswith(f'.{query}')
             if ext_match:
-                results.append(os.path.join(DESKTOP, file))
+                results.append(os.path.join(root, file))
     else:
         for file in files:
             if query in file.lower():
-                results.append(os.path.join(DESKTOP, file))
+                results.append(os.path.join(root, file))
     return results
 
 
+# Duplicate detection: bytes hashed from each end in the cheap stage
+DUP_BLOCK_SIZE = 64 * 1024
+DUP_READ_SIZE = 1024 * 1024
+DUP_WORKERS = int(os.getenv('DUP_WORKERS', '8'))
+DUP_CACHE_SIZE = int(os.getenv('DUP_CACHE_SIZE', '20000'))
+# (dev, inode, kind) -> (size, mtime_ns, digest), so rescans only hash
+# files that are new or changed since the last scan. A changed file
+# replaces its own entry and the least recently used entries are evicted,
+# so the cache stays bounded on a long-running server.
+_hash_cache = OrderedDict()
+_hash_cache_lock = threading.Lock()
+
+
+def _file_digest(path, st, partial):
+    key = (st.st_dev, st.st_ino, partial)
+    with _hash_cache_lock:
+        cached = _hash_cache.get(key)
+        if cached and cached[:2] == (st.st_size, st.st_mtime_ns):
+            _hash_cache.move_to_end(key)
+            return cached[2]
+    h = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        if partial:
+            h.update(f.read(DUP_BLOCK_SIZE))
+            if st.st_size > DUP_BLOCK_SIZE:
+                f.seek(max(DUP_BLOCK_SIZE, st.st_size - DUP_BLOCK_SIZE))
+                h.update(f.read(DUP_BLOCK_SIZE))
+        else:
+            for block in iter(lambda: f.read(DUP_READ_SIZE), b''):
+                h.update(block)
+    digest = h.hexdigest()
+    with _hash_cache_lock:
+        _hash_cache[key] = (st.st_size, st.st_mtime_ns, digest)
+        _hash_cache.move_to_end(key)
+        while len(_hash_cache) > DUP_CACHE_SIZE:
+            _hash_cache.popitem(last=False)
+    return digest
+
+
+def _regroup(pool, groups, partial):
+    """Split each group of (path, stat) pairs by digest; keep dup groups."""
+    candidates = [item for group in groups for item in group]
+
+    def digest(item):
+        try:
+            return _file_digest(item[0], item[1], partial)
+        except OSError as e:
+            print(f"[ERROR] Could not read {item[0]}: {e}")
+            return None
+
+    by_digest = {}
+    for item, d in zip(candidates, pool.map(digest, candidates)):
+        if d is not None:
+            by_digest.setdefault((item[1].st_size, d), []).append(item)
+    return [group for group in by_digest.values() if len(group) > 1]
+
+
+def find_duplicates(root=None, recursive=True):
+    """Return ``[(size, [path, ...]), ...]`` for identical files.
+
+    Files are grouped by size first, then by a hash of their first and
+    last blocks, and only the remaining candidates are hashed in full.
+    Empty files are ignored.
+    """
+    root = root or DESKTOP
+    if not os.path.isdir(root):
+        return []
+    by_size = {}
+    for entry in list_entries(root, recursive):
+        try:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        if st.st_size:
+            by_size.setdefault(st.st_size, []).append((entry.path, st))
+    groups = [group for group in by_size.values() if len(group) > 1]
+    with ThreadPoolExecutor(max_workers=DUP_WORKERS) as pool:
+        groups = _regroup(pool, groups, partial=True)
+        # The partial hash already covered small files completely
+        small = [g for g in groups if g[0][1].st_size <= 2 * DUP_BLOCK_SIZE]
+        large = [g for g in groups if g[0][1].st_size > 2 * DUP_BLOCK_SIZE]
+        groups = small + _regroup(pool, large, partial=False)
+    return sorted(
+        (group[0][1].st_size, sorted(path for path, _ in group))
+        for group in groups
+    )
+
+
+def format_duplicates(groups, root):
+    if not groups:
+        return 'No duplicate files found.'
+    lines = [f'Found {len(groups)} groups of duplicate files:']
+    for idx, (size, group) in enumerate(groups, 1):
+        lines.append(
+            f'[{idx}] {len(group)} copies, {size} bytes each:'
+        )
+        for path in group:
+            lines.append(f'  {os.path.relpath(path, root)}')
+    return '\n'.join(lines)
+
+
+def update_index(func, *args):
+    # The file operation already succeeded; a stale index is fixed by the
+    # next mtime scan, so indexing errors are reported but not raised.
+    try:
+        func(*args)
+    except Exception as e:
+        print(f"[ERROR] Could not update content index: {e}")
+
+
+def search_content(query, root=None, limit=20):
+    """Full-text search of file contents under ``root``."""
+    # The index stores resolved paths, so callers must relativize
+    # results against the resolved root as well
+    root = os.path.realpath(root or DESKTOP)
+    if not os.path.isdir(root):
+        return []
+    return content_index.search(root, query, limit)
+
+
+def format_content_results(results, query, root):
+    root = os.path.realpath(root)
+    if not results:
+        if os.path.isdir(root) and content_index.is_building(root):
+            return (
+                f'No files found containing {query} yet; the search index '
+                f'is still being built, please try again shortly.'
+            )
+        return f'No files found containing {query}.'
+    lines = [f'Found {len(results)} files containing {query}:']
+    for path, snippet in results:
+        snippet = ' '.join(snippet.split())
+        lines.append(f'{os.path.relpath(path, root)}: {snippet}')
+    return '\n'.join(lines)
+
+
 def move_file(src, dst):
-    shutil.move(src, dst)
+    dst = shutil.move(src, dst)
+    update_index(content_index.notify_moved, src, dst)
 
 
 def copy_file(src, dst):
-    shutil.copy2(src, dst)
+    dst = shutil.copy2(src, dst)
+    update_index(content_index.notify_changed, dst)
 
 
 def edit_file(path, find_text=None, replace_text=None, append_text=None):
@@ -61,6 +255,9 @@ def edit_file(path, find_text=None, replace_text=None, append_text=None):
         content = content.replace(find_text, replace_text)
         with open(path, 'w', encoding='utf-8') as f:
             f.write(content)
+    else:
+        return
+    update_index(content_index.notify_changed, path)
 
 
 def create_folder(path):
@@ -73,49 +270,209 @@ def compress_files(file_list, zip_name):
             zipf.write(file, os.path.basename(file))
 
 
-def summarize_file(path):
-    if not os.path.exists(path):
-        print(f"[ERROR] File not found: {path}")
-        return None
-    with open(path, 'r', encoding='utf-8') as f:
-        content = f.read()
-    print(f"[DEBUG] Read {len(content)} characters from {path}.")
-    print(f"[DEBUG] File preview: {repr(content[:100])}")
-    if not content.strip():
-        print(f"[ERROR] File is empty: {path}")
-        return None
+# Archive commands read members through these worker threads; zlib
+# releases the GIL, so decompression of separate members runs in parallel
+ARCHIVE_WORKERS = int(os.getenv('ARCHIVE_WORKERS', '4'))
+ARCHIVE_READ_SIZE = 1024 * 1024
+
+
+def list_archive(archive_path):
+    """Return ``[(name, size, compressed_size), ...]`` for file members."""
+    with zipfile.ZipFile(archive_path, 'r') as zipf:
+        return [
+            (info.filename, info.file_size, info.compress_size)
+            for info in zipf.infolist() if not info.is_dir()
+        ]
+
 
-    # Improved chunking: overlap to avoid topic loss at boundaries
-    chunk_size = 1800
-    overlap = 500  # chars of overlap between chunks
-    chunks = []
-    i = 0
-    while i < len(content):
-        chunk = content[i:i+chunk_size]
-        chunks.append(chunk)
-        if i + chunk_size >= len(content):
+def format_archive_listing(members, archive):
+    if not members:
+        return f'Archive {archive} is empty.'
+    total = sum(size for _, size, _ in members)
+    lines = [f'{archive}: {len(members)} files, {total} bytes uncompressed']
+    for name, size, compressed in members:
+        lines.append(f'  {name}  {size} bytes ({compressed} compressed)')
+    return '\n'.join(lines)
+
+
+def _select_members(zipf, members):
+    infos = [info for info in zipf.infolist() if not info.is_dir()]
+    if not members:
+        return infos
+    by_name = {info.filename: info for info in infos}
+    missing = [m for m in members if m not in by_name]
+    if missing:
+        raise KeyError(f"Not found in archive: {', '.join(missing)}")
+    return [by_name[m] for m in members]
+
+
+def _map_members(archive_path, infos, func):
+    """Run ``func(zipf, info)`` for each member across worker threads.
+
+    Members are dealt out largest first into one batch per worker, and
+    each worker opens its own ``ZipFile`` so reads never share a handle.
+    Results come back in the order of ``infos``.
+    """
+    order = sorted(
+        range(len(infos)), key=lambda k: infos[k].file_size, reverse=True
+    )
+    workers = max(1, min(ARCHIVE_WORKERS, len(infos)))
+    batches = [order[k::workers] for k in range(workers)]
+    results = [None] * len(infos)
+
+    def run(batch):
+        with zipfile.ZipFile(archive_path, 'r') as zipf:
+            for k in batch:
+                results[k] = func(zipf, infos[k])
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(run, batch) for batch in batches]:
+            future.result()
+    return results
+
+
+def grep_archive(archive_path, text, members=None):
+    """Count case-insensitive matches of ``text`` in each member.
+
+    Members are decompressed as a stream in fixed-size blocks and decoded
+    as UTF-8 incrementally, keeping only a ``len(text) - 1`` character
+    tail between blocks, so memory use does not depend on member size.
+    Matching uses ``casefold`` so non-ASCII text matches regardless of
+    case. Returns ``[(name, count), ...]`` for members with at least one
+    match.
+    """
+    needle = text.casefold()
+    if not needle:
+        return []
+    keep = len(needle) - 1
+
+    def count(zipf, info):
+        found = 0
+        tail = ''
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        with zipf.open(info) as f:
+            for block in iter(lambda: f.read(ARCHIVE_READ_SIZE), b''):
+                buf = tail + decoder.decode(block).casefold()
+                found += buf.count(needle)
+                tail = buf[-keep:] if keep else ''
+        found += (tail + decoder.decode(b'', final=True)).count(needle)
+        return found
+
+    with zipfile.ZipFile(archive_path, 'r') as zipf:
+        infos = _select_members(zipf, members)
+    counts = _map_members(archive_path, infos, count)
+    return [
+        (info.filename, found)
+        for info, found in zip(infos, counts) if found
+    ]
+
+
+def format_grep_results(results, text, archive):
+    if not results:
+        return f'No members of {archive} contain "{text}".'
+    lines = [f'Found "{text}" in {len(results)} members of {archive}:']
+    for name, found in results:
+        lines.append(f'  {name}: {found} matches')
+    return '\n'.join(lines)
+
+
+def archive_size(archive_path, members=None):
+    """Total uncompressed size of ``members`` (all files by default)."""
+    with zipfile.ZipFile(archive_path, 'r') as zipf:
+        return sum(i.file_size for i in _select_members(zipf, members))
+
+
+def extract_archive(archive_path, dest, members=None):
+    """Extract ``members`` (or everything) into ``dest`` in parallel.
+
+    Each member is streamed to disk in blocks. Members whose names would
+    land outside ``dest`` are refused. Returns the extracted names.
+    """
+    dest = os.path.realpath(dest)
+    with zipfile.ZipFile(archive_path, 'r') as zipf:
+        infos = _select_members(zipf, members)
+    # Archives may repeat a name; like ZipFile.extractall the last entry
+    # wins, and each target is written by exactly one worker
+    infos = list({info.filename: info for info in infos}.values())
+    targets = {}
+    for info in infos:
+        target = os.path.realpath(os.path.join(dest, info.filename))
+        if not target.startswith(dest + os.sep):
+            raise ValueError(f"Unsafe path in archive: {info.filename}")
+        targets[info.filename] = target
+    for target in set(map(os.path.dirname, targets.values())):
+        os.makedirs(target, exist_ok=True)
+
+    def extract(zipf, info):
+        with zipf.open(info) as src, \
+                open(targets[info.filename], 'wb') as dst:
+            shutil.copyfileobj(src, dst, ARCHIVE_READ_SIZE)
+        return info.filename
+
+    names = _map_members(archive_path, infos, extract)
+    update_index(content_index.notify_changed, dest)
+    return names
+
+
+def _iter_chunks(f, chunk_size=1800, overlap=500):
+    """Yield overlapping chunks read incrementally from text stream ``f``.
+
+    Overlap avoids topic loss at boundaries; only one chunk is in memory.
+    """
+    chunk = f.read(chunk_size)
+    while chunk:
+        yield chunk
+        more = f.read(chunk_size - overlap)
+        if not more:
             break
-        i += chunk_size - overlap
+        chunk = chunk[-overlap:] + more
 
+
+def summarize_stream(f, name):
+    """Summarize text stream ``f`` chunk by chunk, then combine.
+
+    Chunk summaries are requested through the shared LLM pool while later
+    chunks are still being read; at most ``2 * LLM_CONCURRENCY`` chunks
+    per document are in flight so memory stays bounded.
+    """
     chunk_summaries = []
-    for idx, chunk in enumerate(chunks):
-        print(
-            f"[DEBUG] Summarizing chunk {idx+1}/{len(chunks)} "
-            f"(length: {len(chunk)})"
-        )
-        summary = call_llm(chunk)
+    has_text = False
+    in_flight = deque()
+
+    def collect():
+        idx, future = in_flight.popleft()
+        summary = future.result()
         if summary and summary.strip():
             chunk_summaries.append(summary.strip())
         else:
             print(f"[ERROR] No summary generated for chunk {idx+1}")
+
+    for idx, chunk in enumerate(_iter_chunks(f)):
+        if idx == 0:
+            print(f"[DEBUG] File preview: {repr(chunk[:100])}")
+        if not chunk.strip():
+            continue
+        has_text = True
+        print(
+            f"[DEBUG] Summarizing chunk {idx+1} of {name} "
+            f"(length: {len(chunk)})"
+        )
+        in_flight.append((idx, _llm_pool.submit(call_llm, chunk)))
+        if len(in_flight) >= 2 * LLM_CONCURRENCY:
+            collect()
+    while in_flight:
+        collect()
+    if not has_text:
+        print(f"[ERROR] File is empty: {name}")
+        return None
     if not chunk_summaries:
-        print(f"[ERROR] No summaries generated for any chunk in {path}")
+        print(f"[ERROR] No summaries generated for any chunk in {name}")
         return None
     combined = '\n'.join(chunk_summaries)
     print(
         "[DEBUG] Summarizing combined chunk summaries for final summary."
     )
-    final_summary = call_llm(combined)
+    final_summary = _llm_pool.submit(call_llm, combined).result()
     if not final_summary or not final_summary.strip():
         print(
             "[ERROR] No final summary generated, "
@@ -125,6 +482,245 @@ def summarize_file(path):
     return final_summary
 
 
+def summarize_file(path):
+    if not os.path.exists(path):
+        print(f"[ERROR] File not found: {path}")
+        return None
+    print(f"[DEBUG] Reading {os.path.getsize(path)} bytes from {path}.")
+    with open(path, 'r', encoding='utf-8') as f:
+        return summarize_stream(f, path)
+
+
+def summarize_archive_member(archive_path, member):
+    """Summarize ``member`` straight from the compressed stream."""
+    with zipfile.ZipFile(archive_path, 'r') as zipf:
+        info = _select_members(zipf, [member])[0]
+        print(
+            f"[DEBUG] Reading {info.file_size} bytes from {member} "
+            f"in {archive_path}."
+        )
+        with zipf.open(info) as raw:
+            f = io.TextIOWrapper(raw, encoding='utf-8')
+            return summarize_stream(f, f'{member} in {archive_path}')
+
+
+BATCH_INDEX_NAME = 'index.json'
+BATCH_OUTPUT_SUFFIX = '_summary.txt'
+
+
+def _load_batch_index(out_dir):
+    try:
+        with open(os.path.join(out_dir, BATCH_INDEX_NAME), 'r',
+                  encoding='utf-8') as f:
+            return {e['source']: e for e in json.load(f)['files']}
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def _write_atomic(path, text):
+    folder, name = os.path.split(path)
+    tmp_path = os.path.join(folder, f'.{name}.tmp-{threading.get_ident()}')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def batch_sources(folder, pattern='*', out_dir=None):
+    """Files in ``folder`` matching ``pattern``, smallest first.
+
+    The batch's own files are never picked up as inputs: anything inside
+    ``out_dir`` when it is a separate folder, and otherwise its index,
+    temporary files and summaries from earlier runs.
+    """
+    folder_real = os.path.realpath(folder)
+    out_dir = os.path.realpath(out_dir or os.path.join(folder, 'summaries'))
+    outputs = {
+        os.path.realpath(os.path.join(out_dir, e['output']))
+        for e in _load_batch_index(out_dir).values() if e.get('output')
+    }
+    sources = []
+    for entry in list_entries(folder):
+        if not entry.is_file() or not fnmatch.fnmatch(entry.name, pattern):
+            continue
+        path = os.path.realpath(entry.path)
+        if out_dir != folder_real:
+            if path.startswith(out_dir + os.sep):
+                continue
+        elif (entry.name == BATCH_INDEX_NAME
+              or fnmatch.fnmatch(entry.name, '.*.tmp-*')
+              or entry.name.endswith(BATCH_OUTPUT_SUFFIX)):
+            continue
+        if path in outputs:
+            continue
+        sources.append((entry.stat().st_size, entry.path))
+    # Small files first so the first summaries arrive quickly
+    return [path for _, path in sorted(sources)]
+
+
+def _no_lock(reads, writes):
+    return nullcontext()
+
+
+def summarize_batch(folder, pattern='*', out_dir=None, on_result=None,
+                    lock=_no_lock):
+    """Summarize every matching file in ``folder`` into ``out_dir``.
+
+    Documents are read and chunked in parallel while their chunk
+    summaries share the global LLM budget, so a large batch runs at API
+    throughput. Files whose size and mtime match the previous run's
+    ``index.json`` entry are skipped. ``index.json`` is rewritten as each
+    entry finishes, so progress can be followed (and an interrupted run
+    resumed). ``on_result`` is called with each finished entry.
+
+    ``lock(reads, writes)`` returns a context manager held while a source
+    is read or an output written, letting callers lock file by file
+    rather than for the whole batch. Returns the entries of this run.
+    """
+    out_dir = out_dir or os.path.join(folder, 'summaries')
+    index_path = os.path.join(out_dir, BATCH_INDEX_NAME)
+    with lock([], [out_dir]):
+        os.makedirs(out_dir, exist_ok=True)
+    previous = _load_batch_index(out_dir)
+    sources = batch_sources(folder, pattern, out_dir)
+
+    def process(path):
+        name = os.path.relpath(path, folder)
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            # Deleted or renamed since it was listed
+            print(f"[ERROR] Could not read {path}: {e}")
+            return {'source': name, 'output': None, 'status': 'failed'}
+        entry = {
+            'source': name,
+            # The full name keeps a.txt and a.md from sharing an output
+            'output': name + BATCH_OUTPUT_SUFFIX,
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+        }
+        out_path = os.path.join(out_dir, entry['output'])
+        old = previous.get(name)
+        if (old and old.get('status') != 'failed'
+                and old.get('size') == st.st_size
+                and old.get('mtime_ns') == st.st_mtime_ns
+                and os.path.exists(out_path)):
+            entry['status'] = 'unchanged'
+            return entry
+        try:
+            with lock([path], []):
+                summary = summarize_file(path)
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"[ERROR] Could not read {path}: {e}")
+            summary = None
+        if summary:
+            try:
+                with lock([], [out_path]):
+                    _write_atomic(out_path, summary)
+            except Exception as e:
+                print(f"[ERROR] Could not save {out_path}: {e}")
+                summary = None
+        if summary:
+            update_index(content_index.notify_changed, out_path)
+            entry['status'] = 'summarized'
+        else:
+            entry['output'] = None
+            entry['status'] = 'failed'
+        return entry
+
+    def write_index(complete):
+        # Entries from earlier runs (other patterns, or sources still
+        # pending) are kept; vanished sources are dropped once done
+        done = {entry['source'] for entry in entries}
+        kept = [
+            e for name, e in previous.items()
+            if name not in done and (
+                not complete or os.path.isfile(os.path.join(folder, name))
+            )
+        ]
+        data = {
+            'complete': complete,
+            'pending': len(sources) - len(entries),
+            'files': sorted(entries + kept, key=lambda e: e['source']),
+        }
+        try:
+            with lock([], [index_path]):
+                _write_atomic(index_path, json.dumps(data, indent=2))
+        except Exception as e:
+            print(f"[ERROR] Could not save {index_path}: {e}")
+
+    entries = []
+    # Extra document workers keep reading and chunking ahead of the LLM
+    workers = max(1, min(2 * LLM_CONCURRENCY, len(sources)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(process, path) for path in sources]
+        for future in as_completed(futures):
+            entry = future.result()
+            entries.append(entry)
+            if entry['status'] != 'unchanged':
+                write_index(False)
+            if on_result:
+                on_result(entry)
+    write_index(True)
+    entries.sort(key=lambda e: e['source'])
+    return entries
+
+
+def format_batch_entry(entry):
+    if entry['status'] == 'failed':
+        return f"[ERROR] No summary generated for {entry['source']}"
+    return f"{entry['source']} -> {entry['output']} ({entry['status']})"
+
+
+def format_batch_results(entries, out_name):
+    if not entries:
+        return 'No matching files to summarize.'
+    counts = {}
+    for entry in entries:
+        counts[entry['status']] = counts.get(entry['status'], 0) + 1
+    lines = [
+        f"Summarized {counts.get('summarized', 0)}, "
+        f"skipped {counts.get('unchanged', 0)} unchanged, "
+        f"{counts.get('failed', 0)} failed. "
+        f"Index saved to {os.path.join(out_name, BATCH_INDEX_NAME)}"
+    ]
+    lines.extend(format_batch_entry(entry) for entry in entries)
+    return '\n'.join(lines)
+
+
+def parse_batch_command(cmd):
+    """Return (folder, pattern, out_folder) for a batch summarize command.
+
+    ``folder`` and ``out_folder`` are relative to the workspace; None is
+    returned when ``cmd`` is not a batch command.
+    """
+    match = re.match(BATCH_SUMMARIZE_RE, cmd)
+    if match:
+        ext, folder, out = match.groups()
+        if not ext or ext == '*':
+            pattern = '*'
+        else:
+            pattern = '*.' + ext.lstrip('.')
+    else:
+        match = re.match(BATCH_GLOB_RE, cmd)
+        if not match:
+            return None
+        glob, out = match.groups()
+        folder, pattern = os.path.split(glob)
+    folder = folder or '.'
+    return folder, pattern, out or os.path.join(folder, 'summaries')
+
+
+# Global LLM budget: every API call holds one of ``LLM_CONCURRENCY`` slots
+# shared by all worker processes on the host (see ``llm_budget.llm_slot``),
+# and ``LLM_RATE_PER_MIN`` (0 = unlimited) spaces out their start times.
+# ``_llm_pool`` just gives each process enough threads to use the budget.
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '4'))
+LLM_RATE_PER_MIN = float(os.getenv('LLM_RATE_PER_MIN', '0'))
+_llm_pool = ThreadPoolExecutor(
+    max_workers=LLM_CONCURRENCY, thread_name_prefix='llm'
+)
+
+
 def call_llm(text):
     if not HF_TOKEN:
         print("[ERROR] Hugging Face API token not set in .env")
@@ -139,9 +735,10 @@ def call_llm(text):
         "parameters": {"max_length": 2048, "min_length": 300}
     }
     try:
-        resp = requests.post(
-            url, headers=headers, json=payload, timeout=60
-        )
+        with llm_slot(LLM_CONCURRENCY, LLM_RATE_PER_MIN):
+            resp = requests.post(
+                url, headers=headers, json=payload, timeout=60
+            )
         resp.raise_for_status()
         result = resp.json()
         if isinstance(result, list):
@@ -173,11 +770,16 @@ def call_llm(text):
 
 def delete_file(path):
     os.remove(path)
+    update_index(content_index.notify_removed, path)
+
+
+def delete_folder(path):
+    shutil.rmtree(path)
+    update_index(content_index.notify_removed, path)
 
 
 def main():
     print_banner()
-    import re
 
     while True:
         cmd = input('> ').strip()
@@ -185,6 +787,62 @@ def main():
             print('Goodbye!')
             break
 
+        if re.match(r'find (?:all )?duplicate', cmd):
+            print(format_duplicates(find_duplicates(), DESKTOP))
+            continue
+
+        list_match = re.match(ARCHIVE_LIST_RE, cmd)
+        if list_match:
+            archive = list_match.group(1)
+            archive_path = os.path.join(DESKTOP, archive)
+            if not os.path.exists(archive_path):
+                print(f"[ERROR] Archive not found: {archive}")
+            else:
+                print(format_archive_listing(
+                    list_archive(archive_path), archive
+                ))
+            continue
+
+        grep_match = re.match(ARCHIVE_GREP_RE, cmd)
+        if grep_match:
+            text, archive = grep_match.group(1), grep_match.group(2)
+            archive_path = os.path.join(DESKTOP, archive)
+            if not os.path.exists(archive_path):
+                print(f"[ERROR] Archive not found: {archive}")
+            else:
+                print(format_grep_results(
+                    grep_archive(archive_path, text), text, archive
+                ))
+            continue
+
+        extract_match = re.match(ARCHIVE_EXTRACT_RE, cmd)
+        if extract_match:
+            names, archive, folder = extract_match.groups()
+            folder = (folder or os.path.splitext(archive)[0]).strip()
+            members = (
+                [n.strip() for n in names.split(',')] if names else None
+            )
+            archive_path = os.path.join(DESKTOP, archive)
+            if not os.path.exists(archive_path):
+                print(f"[ERROR] Archive not found: {archive}")
+                continue
+            try:
+                extracted = extract_archive(
+                    archive_path, os.path.join(DESKTOP, folder), members
+                )
+                print(f"Extracted {len(extracted)} files to {folder}")
+            except (KeyError, ValueError) as e:
+                print(f"[ERROR] {e.args[0]}")
+            continue
+
+        content_match = re.match(CONTENT_SEARCH_RE, cmd)
+        if content_match:
+            query = content_match.group(1).strip()
+            print(format_content_results(
+                search_content(query), query, DESKTOP
+            ))
+            continue
+
         # Flexible 'find' command parsing
         if cmd.startswith('find'):
             cleaned = (
@@ -340,46 +998,51 @@ def main():
                 )
             continue
 
-        if cmd.startswith('summarize'):
-            zip_match = re.match(
-                r'summarize(?: the content of)? ([^ ]+) from ([^ ]+) '
-                r'and save to ([^ ]+)',
-                cmd
+        batch = parse_batch_command(cmd)
+        if batch:
+            folder, pattern, out_folder = batch
+            folder_path = os.path.join(DESKTOP, folder)
+            if not os.path.isdir(folder_path):
+                print(f"[ERROR] Folder not found: {folder}")
+                continue
+            entries = summarize_batch(
+                folder_path, pattern, os.path.join(DESKTOP, out_folder),
+                on_result=lambda e: print(format_batch_entry(e))
             )
+            print(format_batch_results(entries, out_folder).split('\n')[0])
+            continue
+
+        if cmd.startswith('summarize'):
+            zip_match = re.match(ARCHIVE_SUMMARIZE_RE, cmd)
             if zip_match:
                 file = zip_match.group(1).strip()
                 archive = zip_match.group(2).strip()
-                out_file = zip_match.group(3).strip()
+                out_file = zip_match.group(3)
                 archive_path = os.path.join(DESKTOP, archive)
                 if not os.path.exists(archive_path):
                     print(f"[ERROR] Archive not found: {archive}")
                     continue
-                with zipfile.ZipFile(archive_path, 'r') as zipf:
-                    if file not in zipf.namelist():
-                        print(
-                            f"[ERROR] File {file} not found in archive "
-                            f"{archive}"
-                        )
-                        continue
-                    with zipf.open(file) as f:
-                        content = f.read().decode('utf-8')
-                    if not content.strip():
-                        print(
-                            f"[ERROR] File {file} in archive "
-                            f"{archive} is empty."
-                        )
-                        continue
-                    summary = call_llm(content)
-                    if not summary or not summary.strip():
-                        print(
-                            f"[ERROR] No summary generated for {file} "
-                            f"in archive {archive}"
-                        )
-                        continue
+                try:
+                    summary = summarize_archive_member(archive_path, file)
+                except KeyError:
+                    print(
+                        f"[ERROR] File {file} not found in archive "
+                        f"{archive}"
+                    )
+                    continue
+                if not summary or not summary.strip():
+                    print(
+                        f"[ERROR] No summary generated for {file} "
+                        f"in archive {archive}"
+                    )
+                    continue
+                if out_file:
                     out_path = os.path.join(DESKTOP, out_file)
                     with open(out_path, 'w', encoding='utf-8') as f:
                         f.write(summary)
                     print(f"Summary saved to {out_file}")
+                else:
+                    print(summary)
                 continue
             elif 'and save to' in cmd:
                 file = None
@@ -445,7 +1108,7 @@ def main():
                 path = os.path.join(DESKTOP, folder)
                 if os.path.isdir(path):
                     try:
-                        shutil.rmtree(path)
+                        delete_folder(path)
                         print(f"Deleted folder {folder}")
                     except Exception as e:
                         print(
@@ -1,14 +1,24 @@
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, request, render_template, jsonify, send_file
+from contextlib import ExitStack
+from werkzeug.formparser import parse_form_data
+from werkzeug.utils import secure_filename
+import io
 import re
 import os
-import shutil
+import uuid
+import threading
 
 import agent  # Import your CLI logic
+from workspace import (
+    COOKIE_NAME, QuotaExceeded, check_quota, ensure_workspace, locked,
+    remaining_quota, resolve, session_workspace, staging_dir,
+)
 
-# Use a safe, writable directory for all file operations in Cloud Run
-DESKTOP = '/tmp/byte_agents'
-# Ensure the directory exists at startup
-os.makedirs(DESKTOP, exist_ok=True)
+# Each session / API key works in its own namespace under
+# workspace.WORKSPACE_ROOT, which the workspace module creates at startup.
+
+# Uploads are copied to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 app = Flask(__name__)
 
@@ -23,13 +33,304 @@ def handle_command():
     cmd = request.form.get('cmd', '').strip()
     if not cmd:
         return jsonify({'output': 'No command provided.'})
-    output = run_command(cmd)
-    return jsonify({'output': output})
+    root, new_id = session_workspace(request)
+    output = run_command(cmd, root)
+    return with_session(jsonify({'output': output}), new_id)
+
+
+def with_session(resp, new_id):
+    if new_id:
+        resp.set_cookie(COOKIE_NAME, new_id, httponly=True, samesite='Lax')
+    return resp
+
+
+def _temp_upload_path(root):
+    # Staged outside the workspace and renamed into place only once
+    # complete, so listings, scans and quota never see a partial upload
+    return os.path.join(staging_dir(root), uuid.uuid4().hex)
+
+
+class _QuotaFile(io.FileIO):
+    """Upload file that aborts once ``budget[0]`` bytes are used up.
+
+    The budget list is shared by every part of one request, so quota is
+    enforced while streaming even when no Content-Length was sent.
+    """
+
+    def __init__(self, path, budget):
+        super().__init__(path, 'w+')
+        self.budget = budget
+
+    def write(self, data):
+        self.budget[0] -= len(data)
+        if self.budget[0] < 0:
+            raise QuotaExceeded("Upload exceeds the workspace quota")
+        return super().write(data)
+
+
+def _error(message, status, new_id):
+    output = f"[ERROR] {message}"
+    return with_session(jsonify({'output': output}), new_id), status
+
+
+def _finish_upload(root, tmp_path, path):
+    with locked(root, writes=[path]):
+        os.replace(tmp_path, path)
+    agent.update_index(agent.content_index.notify_changed, path)
+
+
+@app.route('/upload', methods=['POST'])
+def upload():
+    """Stream multipart file parts straight to disk.
+
+    Each part is written to a staging file as it is parsed, then moved
+    into the target folder (the ``folder`` query parameter), so the
+    request body is never held in memory.
+    """
+    root, new_id = session_workspace(request)
+    uploads = []
+    budget = [0]
+
+    def stream_factory(total_content_length, content_type, filename,
+                       content_length=None):
+        f = _QuotaFile(_temp_upload_path(root), budget)
+        uploads.append((f, secure_filename(filename or '')))
+        return f
+
+    try:
+        folder_path = resolve(root, request.args.get('folder', ''))
+        ensure_workspace(root)
+        if not os.path.isdir(folder_path):
+            return _error(
+                "Folder not found: {}".format(request.args.get('folder')),
+                404, new_id
+            )
+        check_quota(root, request.content_length or 0)
+        budget[0] = remaining_quota(root)
+        parse_form_data(request.environ, stream_factory=stream_factory)
+        # Close every staged part, not just one per field name
+        for f, _ in uploads:
+            f.close()
+        check_quota(root, sum(os.path.getsize(f.name) for f, _ in uploads))
+        saved = []
+        for f, name in uploads:
+            if not name:
+                os.remove(f.name)
+                continue
+            _finish_upload(root, f.name, os.path.join(folder_path, name))
+            saved.append(name)
+        if not saved:
+            return _error("No files uploaded.", 400, new_id)
+        output = "Uploaded {}".format(', '.join(saved))
+        return with_session(jsonify({'output': output}), new_id)
+    except QuotaExceeded as e:
+        return _error(e, 413, new_id)
+    except ValueError as e:
+        return _error(e, 400, new_id)
+    except OSError as e:
+        return _error(f"Upload failed: {e}", 500, new_id)
+    finally:
+        for f, _ in uploads:
+            f.close()
+            if os.path.exists(f.name):
+                os.remove(f.name)
 
 
-def run_command(cmd):
-    """Process command and return output as string."""
+@app.route('/files/<path:name>', methods=['PUT'])
+def put_file(name):
+    """Stream a raw request body into ``name`` in fixed-size chunks."""
+    root, new_id = session_workspace(request)
+    tmp_path = None
     try:
+        path = resolve(root, name)
+        ensure_workspace(root)
+        if not os.path.isdir(os.path.dirname(path)):
+            return _error(f"Folder not found for: {name}", 404, new_id)
+        check_quota(root, request.content_length or 0)
+        tmp_path = _temp_upload_path(root)
+        with _QuotaFile(tmp_path, [remaining_quota(root)]) as f:
+            for block in iter(
+                    lambda: request.stream.read(UPLOAD_CHUNK_SIZE), b''):
+                f.write(block)
+        check_quota(root, os.path.getsize(tmp_path))
+        _finish_upload(root, tmp_path, path)
+        output = f"Uploaded {name}"
+        return with_session(jsonify({'output': output}), new_id), 201
+    except QuotaExceeded as e:
+        return _error(e, 413, new_id)
+    except ValueError as e:
+        return _error(e, 400, new_id)
+    except OSError as e:
+        return _error(f"Upload failed: {e}", 500, new_id)
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@app.route('/files/<path:name>', methods=['GET'])
+def download(name):
+    """Serve a workspace file with Range, ETag and If-None-Match support.
+
+    ``send_file`` hands the open file to the server's ``wsgi.file_wrapper``
+    (``sendfile`` under gunicorn). A shared lock is held until the
+    response is closed so the file cannot change mid-transfer.
+    """
+    root, new_id = session_workspace(request)
+    try:
+        path = resolve(root, name)
+    except ValueError as e:
+        output = f"[ERROR] {e}"
+        return with_session(jsonify({'output': output}), new_id), 400
+    stack = ExitStack()
+    stack.enter_context(locked(root, reads=[path]))
+    try:
+        if not os.path.isfile(path):
+            stack.close()
+            output = f"[ERROR] File not found: {name}"
+            return with_session(jsonify({'output': output}), new_id), 404
+        resp = send_file(
+            path, as_attachment=True, conditional=True, etag=True,
+            max_age=0
+        )
+    except BaseException:
+        stack.close()
+        raise
+    resp.call_on_close(stack.close)
+    return with_session(resp, new_id)
+
+
+# Output folders with a batch summary running in this process
+_batches = set()
+_batches_lock = threading.Lock()
+
+
+def _start_batch(root, folder_path, pattern, out_path):
+    """Summarize a batch on a background thread.
+
+    Sources and outputs are locked one file at a time while the batch
+    runs, and quota is checked before each write. Returns False if a
+    batch is already writing to ``out_path``.
+    """
+    key = os.path.realpath(out_path)
+    with _batches_lock:
+        if key in _batches:
+            return False
+        _batches.add(key)
+
+    def batch_lock(reads, writes):
+        if writes:
+            check_quota(root)
+        return locked(root, reads=reads, writes=writes, create=False)
+
+    def run():
+        try:
+            agent.summarize_batch(
+                folder_path, pattern, out_path, lock=batch_lock
+            )
+        except Exception as e:
+            print(f"[ERROR] Batch summary of {folder_path} failed: {e}")
+        finally:
+            with _batches_lock:
+                _batches.discard(key)
+
+    threading.Thread(target=run, daemon=True).start()
+    return True
+
+
+def run_command(cmd, root):
+    """Process command inside workspace ``root`` and return output."""
+    try:
+        # Find duplicates command
+        if re.match(r'find (?:all )?duplicate', cmd):
+            groups = agent.find_duplicates(root)
+            return agent.format_duplicates(groups, root)
+
+        # Archive listing command
+        list_match = re.match(agent.ARCHIVE_LIST_RE, cmd)
+        if list_match:
+            archive = list_match.group(1)
+            archive_path = resolve(root, archive)
+            with locked(root, reads=[archive_path]):
+                if not os.path.exists(archive_path):
+                    return f"[ERROR] Archive not found: {archive}"
+                members = agent.list_archive(archive_path)
+            return agent.format_archive_listing(members, archive)
+
+        # Archive grep command
+        grep_match = re.match(agent.ARCHIVE_GREP_RE, cmd)
+        if grep_match:
+            text, archive = grep_match.group(1), grep_match.group(2)
+            archive_path = resolve(root, archive)
+            with locked(root, reads=[archive_path]):
+                if not os.path.exists(archive_path):
+                    return f"[ERROR] Archive not found: {archive}"
+                results = agent.grep_archive(archive_path, text)
+            return agent.format_grep_results(results, text, archive)
+
+        # Archive extract command
+        extract_match = re.match(agent.ARCHIVE_EXTRACT_RE, cmd)
+        if extract_match:
+            names, archive, folder = extract_match.groups()
+            folder = (folder or os.path.splitext(archive)[0]).strip()
+            members = (
+                [n.strip() for n in names.split(',')] if names else None
+            )
+            archive_path = resolve(root, archive)
+            folder_path = resolve(root, folder)
+            with locked(root, reads=[archive_path], writes=[folder_path]):
+                if not os.path.exists(archive_path):
+                    return f"[ERROR] Archive not found: {archive}"
+                try:
+                    check_quota(
+                        root, agent.archive_size(archive_path, members)
+                    )
+                    extracted = agent.extract_archive(
+                        archive_path, folder_path, members
+                    )
+                except (KeyError, ValueError) as e:
+                    return f"[ERROR] {e.args[0]}"
+            return f"Extracted {len(extracted)} files to {folder}"
+
+        # Summarize from archive command
+        zip_match = re.match(agent.ARCHIVE_SUMMARIZE_RE, cmd)
+        if zip_match:
+            file = zip_match.group(1).strip()
+            archive = zip_match.group(2).strip()
+            out_file = zip_match.group(3)
+            archive_path = resolve(root, archive)
+            with locked(root, reads=[archive_path]):
+                if not os.path.exists(archive_path):
+                    return f"[ERROR] Archive not found: {archive}"
+                try:
+                    summary = agent.summarize_archive_member(
+                        archive_path, file
+                    )
+                except KeyError:
+                    return (
+                        f"[ERROR] File {file} not found in archive "
+                        f"{archive}"
+                    )
+            if not summary or not summary.strip():
+                return (
+                    f"[ERROR] No summary generated for {file} "
+                    f"in archive {archive}"
+                )
+            if not out_file:
+                return summary
+            out_path = resolve(root, out_file)
+            with locked(root, writes=[out_path]):
+                check_quota(root, len(summary.encode('utf-8')))
+                with open(out_path, 'w', encoding='utf-8') as f:
+                    f.write(summary)
+            return f"Summary saved to {out_file}"
+
+        # Content search command
+        content_match = re.match(agent.CONTENT_SEARCH_RE, cmd)
+        if content_match:
+            query = content_match.group(1).strip()
+            results = agent.search_content(query, root)
+            return agent.format_content_results(results, query, root)
+
         # Find command
         if cmd.startswith('find'):
             cleaned = (
@@ -42,7 +343,10 @@ def run_command(cmd):
             )
             if not cleaned:
                 return 'Please specify what to search for.'
-            results = agent.search_files(cleaned)
+            results = [
+                os.path.relpath(r, root)
+                for r in agent.search_files(cleaned, root)
+            ]
             if results:
                 return 'Found {} files:\n{}'.format(
                     len(results), '\n'.join(results)
@@ -56,11 +360,12 @@ def run_command(cmd):
             if match:
                 src = match.group(1).strip()
                 dst = match.group(2).strip()
-                src_path = os.path.join(DESKTOP, src)
-                dst_path = os.path.join(DESKTOP, dst)
-                if not os.path.exists(src_path):
-                    return f"[ERROR] Source file not found: {src}"
-                agent.move_file(src_path, dst_path)
+                src_path = resolve(root, src)
+                dst_path = resolve(root, dst)
+                with locked(root, writes=[src_path, dst_path]):
+                    if not os.path.exists(src_path):
+                        return f"[ERROR] Source file not found: {src}"
+                    agent.move_file(src_path, dst_path)
                 return f"Moved {src} to {dst}"
             return "Sorry, I didn't understand that move command."
 
@@ -70,11 +375,13 @@ def run_command(cmd):
             if match:
                 src = match.group(1).strip()
                 dst = match.group(2).strip()
-                src_path = os.path.join(DESKTOP, src)
-                dst_path = os.path.join(DESKTOP, dst)
-                if not os.path.exists(src_path):
-                    return f"[ERROR] Source file not found: {src}"
-                agent.copy_file(src_path, dst_path)
+                src_path = resolve(root, src)
+                dst_path = resolve(root, dst)
+                with locked(root, reads=[src_path], writes=[dst_path]):
+                    if not os.path.exists(src_path):
+                        return f"[ERROR] Source file not found: {src}"
+                    check_quota(root, os.path.getsize(src_path))
+                    agent.copy_file(src_path, dst_path)
                 return f"Copied {src} to {dst}"
             return "Sorry, I didn't understand that copy command."
 
@@ -84,10 +391,12 @@ def run_command(cmd):
             if match:
                 text = match.group(1)
                 file = match.group(2).strip()
-                file_path = os.path.join(DESKTOP, file)
-                if not os.path.exists(file_path):
-                    return f"[ERROR] File not found: {file}"
-                agent.edit_file(file_path, append_text=text)
+                file_path = resolve(root, file)
+                with locked(root, writes=[file_path]):
+                    if not os.path.exists(file_path):
+                        return f"[ERROR] File not found: {file}"
+                    check_quota(root, len(text.encode('utf-8')) + 1)
+                    agent.edit_file(file_path, append_text=text)
                 return f"Appended text to {file}"
             return (
                 "Sorry, I didn't understand that append command. "
@@ -103,10 +412,14 @@ def run_command(cmd):
                 old = match.group(1)
                 new = match.group(2)
                 file = match.group(3).strip()
-                file_path = os.path.join(DESKTOP, file)
-                if not os.path.exists(file_path):
-                    return f"[ERROR] File not found: {file}"
-                agent.edit_file(file_path, find_text=old, replace_text=new)
+                file_path = resolve(root, file)
+                with locked(root, writes=[file_path]):
+                    if not os.path.exists(file_path):
+                        return f"[ERROR] File not found: {file}"
+                    check_quota(root)
+                    agent.edit_file(
+                        file_path, find_text=old, replace_text=new
+                    )
                 return f"Replaced text in {file}"
             return (
                 "Sorry, I didn't understand that replace command. "
@@ -118,10 +431,11 @@ def run_command(cmd):
             match = re.match(r'(?:create|make) folder\s+(.+)', cmd)
             if match:
                 folder = match.group(1).strip()
-                folder_path = os.path.join(DESKTOP, folder)
-                if os.path.exists(folder_path):
-                    return f"[ERROR] Folder already exists: {folder}"
-                agent.create_folder(folder_path)
+                folder_path = resolve(root, folder)
+                with locked(root, writes=[folder_path]):
+                    if os.path.exists(folder_path):
+                        return f"[ERROR] Folder already exists: {folder}"
+                    agent.create_folder(folder_path)
                 return f"Created folder {folder}"
             return (
                 "Sorry, I didn't understand that create folder command. "
@@ -133,11 +447,13 @@ def run_command(cmd):
             match = re.match(r'create file\s+(.+)', cmd)
             if match:
                 file = match.group(1).strip()
-                file_path = os.path.join(DESKTOP, file)
-                if os.path.exists(file_path):
-                    return f"[ERROR] File already exists: {file}"
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write("")
+                file_path = resolve(root, file)
+                with locked(root, writes=[file_path]):
+                    if os.path.exists(file_path):
+                        return f"[ERROR] File already exists: {file}"
+                    check_quota(root)
+                    with open(file_path, 'w', encoding='utf-8') as f:
+                        f.write("")
                 return f"Created file {file}"
             return (
                 "Sorry, I didn't understand that create file command. "
@@ -151,18 +467,22 @@ def run_command(cmd):
                 files_str = match.group(1).strip()
                 zip_name = match.group(2).strip()
                 file_names = [f.strip() for f in files_str.split(',')]
-                file_paths = [os.path.join(DESKTOP, f) for f in file_names]
-                missing = [
-                    f for f, p in zip(file_names, file_paths)
-                    if not os.path.exists(p)
-                ]
-                if missing:
-                    return (
-                        f"[ERROR] These files were not found: "
-                        f"{', '.join(missing)}"
+                file_paths = [resolve(root, f) for f in file_names]
+                zip_path = resolve(root, zip_name)
+                with locked(root, reads=file_paths, writes=[zip_path]):
+                    missing = [
+                        f for f, p in zip(file_names, file_paths)
+                        if not os.path.exists(p)
+                    ]
+                    if missing:
+                        return (
+                            f"[ERROR] These files were not found: "
+                            f"{', '.join(missing)}"
+                        )
+                    check_quota(
+                        root, sum(os.path.getsize(p) for p in file_paths)
                     )
-                zip_path = os.path.join(DESKTOP, zip_name)
-                agent.compress_files(file_paths, zip_path)
+                    agent.compress_files(file_paths, zip_path)
                 return f"Created zip archive {zip_name}"
             return (
                 "Sorry, I didn't understand that zip command. "
@@ -180,21 +500,22 @@ def run_command(cmd):
                     .replace('from my desktop', '')
                     .strip()
                 )
-                path = os.path.join(DESKTOP, folder)
-                if os.path.isdir(path):
-                    try:
-                        shutil.rmtree(path)
-                        return f"Deleted folder {folder}"
-                    except Exception as e:
+                path = resolve(root, folder)
+                with locked(root, writes=[path]):
+                    if os.path.isdir(path):
+                        try:
+                            agent.delete_folder(path)
+                            return f"Deleted folder {folder}"
+                        except Exception as e:
+                            return (
+                                f"[ERROR] Could not delete folder "
+                                f"'{folder}': {e}"
+                            )
+                    else:
                         return (
-                            f"[ERROR] Could not delete folder "
-                            f"'{folder}': {e}"
+                            f"[ERROR] Folder '{folder}' not found "
+                            f"on your desktop."
                         )
-                else:
-                    return (
-                        f"[ERROR] Folder '{folder}' not found "
-                        f"on your desktop."
-                    )
             else:
                 file_match = re.match(r'delete (?:the )?file\s+(.+)', cmd)
                 if file_match:
@@ -203,27 +524,52 @@ def run_command(cmd):
                         .replace('from my desktop', '')
                         .strip()
                     )
-                    path = os.path.join(DESKTOP, file)
-                    if os.path.isfile(path):
-                        try:
-                            agent.delete_file(path)
-                            return f"Deleted file '{file}'"
-                        except Exception as e:
+                    path = resolve(root, file)
+                    with locked(root, writes=[path]):
+                        if os.path.isfile(path):
+                            try:
+                                agent.delete_file(path)
+                                return f"Deleted file '{file}'"
+                            except Exception as e:
+                                return (
+                                    f"[ERROR] Could not delete file "
+                                    f"'{file}': {e}"
+                                )
+                        else:
                             return (
-                                f"[ERROR] Could not delete file "
-                                f"'{file}': {e}"
+                                f"[ERROR] File '{file}' not found "
+                                f"on your desktop."
                             )
-                    else:
-                        return (
-                            f"[ERROR] File '{file}' not found "
-                            f"on your desktop."
-                        )
                 else:
                     return (
                         "[ERROR] Please specify a valid file or "
                         "folder to delete."
                     )
 
+        # Batch summarize command
+        batch = agent.parse_batch_command(cmd)
+        if batch:
+            folder, pattern, out_folder = batch
+            folder_path = resolve(root, folder)
+            out_path = resolve(root, out_folder)
+            with locked(root, reads=[folder_path]):
+                if not os.path.isdir(folder_path):
+                    return f"[ERROR] Folder not found: {folder}"
+                sources = agent.batch_sources(folder_path, pattern, out_path)
+            if not sources:
+                return agent.format_batch_results([], out_folder)
+            check_quota(root)
+            if not _start_batch(root, folder_path, pattern, out_path):
+                return (
+                    f"[ERROR] A batch summary is already writing to "
+                    f"{out_folder}"
+                )
+            index_name = os.path.join(out_folder, agent.BATCH_INDEX_NAME)
+            return (
+                f"Summarizing {len(sources)} files in the background. "
+                f"Progress is saved to {index_name} as each file finishes."
+            )
+
         # Summarize command
         if cmd.startswith('summarize'):
             if 'and save to' in cmd:
@@ -244,19 +590,20 @@ def run_command(cmd):
                             f"[ERROR] Could not parse input/output "
                             f"filenames from command: {cmd}"
                         )
-                file_path = os.path.join(DESKTOP, file)
-                out_path = os.path.join(DESKTOP, out_file)
-                summary = agent.summarize_file(file_path)
-                if summary:
+                file_path = resolve(root, file)
+                out_path = resolve(root, out_file)
+                with locked(root, reads=[file_path]):
+                    summary = agent.summarize_file(file_path)
+                error_msg = (
+                    "[ERROR] No summary generated or file is empty."
+                )
+                with locked(root, writes=[out_path]):
+                    check_quota(root, len((summary or '').encode('utf-8')))
                     with open(out_path, 'w', encoding='utf-8') as f:
-                        f.write(summary)
+                        f.write(summary or error_msg)
+                if summary:
                     return f"Summary saved to {out_file}"
                 else:
-                    error_msg = (
-                        "[ERROR] No summary generated or file is empty."
-                    )
-                    with open(out_path, 'w', encoding='utf-8') as f:
-                        f.write(error_msg)
                     return (
                         f"[ERROR] No summary generated or file is empty. "
                         f"See {out_file}"
@@ -264,8 +611,9 @@ def run_command(cmd):
             else:
                 if 'of' in cmd:
                     file = cmd.split('of')[1].strip()
-                    file_path = os.path.join(DESKTOP, file)
-                    summary = agent.summarize_file(file_path)
+                    file_path = resolve(root, file)
+                    with locked(root, reads=[file_path]):
+                        summary = agent.summarize_file(file_path)
                     if summary:
                         return summary
                     else:
@@ -274,6 +622,8 @@ def run_command(cmd):
                             f"file is empty: {file}"
                         )
         return "Sorry, I didn't understand that command."
+    except QuotaExceeded as e:
+        return f"[ERROR] {e}"
     except Exception as e:
         return f"[ERROR] Exception: {e}"
 
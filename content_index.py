@@ -0,0 +1,376 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+
+# One SQLite FTS5 database per indexed root, kept outside the root itself
+# so it never shows up in listings, searches or workspace quotas.
+INDEX_DIR = os.getenv(
+    'INDEX_DIR', os.path.join(tempfile.gettempdir(), 'byte_agents_index')
+)
+# Files larger than this are skipped rather than indexed
+INDEX_MAX_BYTES = int(os.getenv('INDEX_MAX_MB', '50')) * 1024 * 1024
+# Minimum seconds between mtime scans that pick up outside changes
+INDEX_SCAN_INTERVAL = float(os.getenv('INDEX_SCAN_INTERVAL', '30'))
+SNIFF_BYTES = 8192
+# Files per transaction during a scan, so notify_* writers in other
+# workers are never locked out for long
+SCAN_BATCH = 200
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(
+    content, tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+def _db_path(root):
+    root = os.path.realpath(root)
+    digest = hashlib.sha1(root.encode('utf-8')).hexdigest()
+    return os.path.join(INDEX_DIR, digest + '.db')
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    # WAL lets searches in other workers run while one worker writes
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def open_index(root):
+    """Open (creating if needed) the index for ``root``."""
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    conn = _connect(_db_path(root))
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _find_index(path):
+    """Return (root, db_path) of an existing index covering ``path``."""
+    parent = os.path.dirname(os.path.realpath(path))
+    while True:
+        db_path = _db_path(parent)
+        if os.path.exists(db_path):
+            return parent, db_path
+        up = os.path.dirname(parent)
+        if up == parent:
+            return None, None
+        parent = up
+
+
+def _read_text(path, size):
+    if size > INDEX_MAX_BYTES:
+        return None
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+        if b'\0' in head:
+            return None
+        data = head + f.read()
+    return data.decode('utf-8', errors='replace')
+
+
+def _index_file(conn, path, st=None):
+    st = st or os.stat(path)
+    row = conn.execute(
+        'SELECT id, size, mtime_ns FROM files WHERE path = ?', (path,)
+    ).fetchone()
+    if row and row[1] == st.st_size and row[2] == st.st_mtime_ns:
+        return False
+    try:
+        text = _read_text(path, st.st_size)
+    except OSError:
+        text = None
+    if row:
+        conn.execute('DELETE FROM docs WHERE rowid = ?', (row[0],))
+        conn.execute(
+            'UPDATE files SET size = ?, mtime_ns = ? WHERE id = ?',
+            (st.st_size, st.st_mtime_ns, row[0])
+        )
+        file_id = row[0]
+    else:
+        file_id = conn.execute(
+            'INSERT INTO files (path, size, mtime_ns) VALUES (?, ?, ?)',
+            (path, st.st_size, st.st_mtime_ns)
+        ).lastrowid
+    # Binary and oversized files are tracked (so they are not re-read on
+    # every scan) but have no searchable content
+    if text:
+        conn.execute(
+            'INSERT INTO docs (rowid, content) VALUES (?, ?)',
+            (file_id, text)
+        )
+    return True
+
+
+def _remove(conn, path):
+    prefix = path.rstrip(os.sep) + os.sep
+    rows = conn.execute(
+        'SELECT id FROM files WHERE path = ? OR substr(path, 1, ?) = ?',
+        (path, len(prefix), prefix)
+    ).fetchall()
+    for (file_id,) in rows:
+        conn.execute('DELETE FROM docs WHERE rowid = ?', (file_id,))
+        conn.execute('DELETE FROM files WHERE id = ?', (file_id,))
+
+
+def _walk(conn, path):
+    if os.path.isdir(path):
+        for dirpath, _, filenames in os.walk(path):
+            for filename in filenames:
+                full = os.path.join(dirpath, filename)
+                try:
+                    _index_file(conn, full)
+                except OSError:
+                    pass
+    elif os.path.isfile(path):
+        _index_file(conn, path)
+
+
+def _claim_scan(conn, force):
+    """Atomically claim the next scan; False if one ran too recently.
+
+    The claim is shared through the database, so only one worker process
+    scans a root per ``INDEX_SCAN_INTERVAL``.
+    """
+    now = time.time()
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute(
+            "SELECT value FROM meta WHERE key = 'scan_started'"
+        ).fetchone()
+        if not force and row and now - float(row[0]) < INDEX_SCAN_INTERVAL:
+            return False
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) "
+            "VALUES ('scan_started', ?)", (str(now),)
+        )
+    return True
+
+
+def _scan(conn, root):
+    pending = 0
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            try:
+                if _index_file(conn, os.path.join(dirpath, filename)):
+                    pending += 1
+            except OSError:
+                continue
+            if pending >= SCAN_BATCH:
+                conn.commit()
+                pending = 0
+    conn.commit()
+    known = conn.execute('SELECT id, path FROM files').fetchall()
+    for k, (file_id, path) in enumerate(known, 1):
+        if not os.path.isfile(path):
+            conn.execute('DELETE FROM docs WHERE rowid = ?', (file_id,))
+            conn.execute('DELETE FROM files WHERE id = ?', (file_id,))
+        if k % SCAN_BATCH == 0:
+            conn.commit()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) "
+            "VALUES ('scanned', ?)", (str(time.time()),)
+        )
+
+
+def refresh(root, force=False):
+    """Bring the index up to date with an mtime scan of ``root``.
+
+    Only files whose size or mtime changed are re-read, and changes are
+    committed in batches of ``SCAN_BATCH``. Scans are skipped if one
+    started less than ``INDEX_SCAN_INTERVAL`` seconds ago, unless
+    ``force`` is set.
+    """
+    root = os.path.realpath(root)
+    conn = open_index(root)
+    try:
+        if _claim_scan(conn, force):
+            _scan(conn, root)
+    finally:
+        conn.close()
+
+
+_scanning = set()
+_scanning_lock = threading.Lock()
+
+
+def refresh_in_background(root):
+    """Start ``refresh(root)`` on a daemon thread unless one is running."""
+    root = os.path.realpath(root)
+    with _scanning_lock:
+        if root in _scanning:
+            return
+        _scanning.add(root)
+
+    def run():
+        try:
+            refresh(root)
+        except (OSError, sqlite3.Error) as e:
+            print(f"[ERROR] Could not refresh content index: {e}")
+        finally:
+            with _scanning_lock:
+                _scanning.discard(root)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def is_building(root):
+    """True until the first scan of ``root`` has completed."""
+    conn = open_index(root)
+    try:
+        return conn.execute(
+            "SELECT 1 FROM meta WHERE key = 'scanned'"
+        ).fetchone() is None
+    finally:
+        conn.close()
+
+
+def notify_changed(path):
+    """Re-index ``path`` (a file or folder) if it lies in an indexed root."""
+    root, db_path = _find_index(path)
+    if not db_path:
+        return
+    conn = _connect(db_path)
+    try:
+        with conn:
+            _walk(conn, os.path.realpath(path))
+    finally:
+        conn.close()
+
+
+def notify_removed(path):
+    """Drop ``path`` (a file or folder) from any index covering it."""
+    root, db_path = _find_index(path)
+    if not db_path:
+        return
+    conn = _connect(db_path)
+    try:
+        with conn:
+            _remove(conn, os.path.realpath(path))
+    finally:
+        conn.close()
+
+
+def notify_moved(src, dst):
+    """Re-point index entries after ``src`` was renamed to ``dst``.
+
+    A rename keeps content and mtime, so rows are updated in place instead
+    of re-reading the files.
+    """
+    src, dst = os.path.realpath(src), os.path.realpath(dst)
+    src_root, db_path = _find_index(src)
+    dst_root, _ = _find_index(dst)
+    if src_root != dst_root:
+        notify_removed(src)
+        notify_changed(dst)
+        return
+    if not db_path:
+        return
+    conn = _connect(db_path)
+    try:
+        with conn:
+            # Whatever the move overwrote is gone
+            _remove(conn, dst)
+            prefix = src.rstrip(os.sep) + os.sep
+            conn.execute(
+                'UPDATE files SET path = ? || substr(path, ?) '
+                'WHERE path = ? OR substr(path, 1, ?) = ?',
+                (dst, len(src) + 1, src, len(prefix), prefix)
+            )
+    finally:
+        conn.close()
+
+
+def build_query(text):
+    """Turn user input into an FTS5 query.
+
+    Quoted parts become phrases and the remaining words single terms.
+    Everything is re-quoted so FTS5 operators in user input are inert.
+    """
+    parts = []
+    for m in re.finditer(r'"([^"]+)"|\'([^\']+)\'|(\S+)', text):
+        words = re.findall(r'\w+', m.group(1) or m.group(2) or m.group(3))
+        if words:
+            parts.append('"' + ' '.join(words) + '"')
+    return parts
+
+
+def search(root, text, limit=20):
+    """Return ``[(path, snippet), ...]`` best match first.
+
+    All terms and phrases must match; if nothing does, the terms are
+    OR-ed instead so the best partial matches are still ranked. Queries
+    are answered from the index as it stands; a due mtime scan runs in
+    the background rather than delaying the answer.
+    """
+    parts = build_query(text)
+    if not parts:
+        return []
+    refresh_in_background(root)
+    conn = open_index(root)
+    try:
+        for joiner in (' AND ', ' OR '):
+            rows = _live_matches(conn, joiner.join(parts), limit)
+            if rows or len(parts) == 1:
+                return rows
+        return []
+    finally:
+        conn.close()
+
+
+def _live_matches(conn, query, limit):
+    """Top ``limit`` matches whose files still exist.
+
+    Files deleted outside the agent linger until the next scan, so results
+    are fetched page by page, skipping (and pruning) stale rows until
+    ``limit`` live files are found or the matches run out.
+    """
+    rows, stale = [], []
+    offset = 0
+    while len(rows) < limit:
+        page = conn.execute(
+            "SELECT files.id, files.path, "
+            "snippet(docs, 0, '[', ']', '...', 12) "
+            "FROM docs JOIN files ON files.id = docs.rowid "
+            "WHERE docs MATCH ? ORDER BY bm25(docs) LIMIT ? OFFSET ?",
+            (query, limit, offset)
+        ).fetchall()
+        for file_id, path, snippet in page:
+            if os.path.isfile(path):
+                rows.append((path, snippet))
+            else:
+                stale.append(file_id)
+        if len(page) < limit:
+            break
+        offset += limit
+    if stale:
+        with conn:
+            for file_id in stale:
+                conn.execute('DELETE FROM docs WHERE rowid = ?', (file_id,))
+                conn.execute('DELETE FROM files WHERE id = ?', (file_id,))
+    return rows[:limit]
+
+
+def drop_index(root):
+    """Delete the index database for ``root`` (e.g. when it is removed)."""
+    db_path = _db_path(root)
+    for suffix in ('', '-wal', '-shm'):
+        try:
+            os.remove(db_path + suffix)
+        except FileNotFoundError:
+            pass
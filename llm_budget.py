@@ -0,0 +1,93 @@
+import os
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to a per-process budget
+    fcntl = None
+
+# Shared LLM call budget. Slot and rate files live here, so every worker
+# process on the host (CLI or gunicorn) draws from the same budget.
+LLM_LOCK_DIR = os.getenv(
+    'LLM_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'byte_agents_llm')
+)
+LLM_POLL_SECONDS = 0.05
+_llm_fallback_lock = threading.Lock()
+_llm_fallback = {'next': 0.0, 'slots': None}
+
+
+def _wait_for_rate(rate_per_min):
+    if rate_per_min <= 0:
+        return
+    interval = 60.0 / rate_per_min
+    if fcntl is None:
+        with _llm_fallback_lock:
+            now = time.time()
+            start = max(now, _llm_fallback['next'])
+            _llm_fallback['next'] = start + interval
+    else:
+        fd = os.open(
+            os.path.join(LLM_LOCK_DIR, 'next_start'),
+            os.O_RDWR | os.O_CREAT, 0o600
+        )
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            raw = os.pread(fd, 64, 0)
+            now = time.time()
+            try:
+                start = max(now, float(raw))
+            except ValueError:
+                start = now
+            data = repr(start + interval).encode('ascii')
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, data, 0)
+        finally:
+            os.close(fd)
+    if start > now:
+        time.sleep(start - now)
+
+
+@contextmanager
+def llm_slot(concurrency, rate_per_min=0):
+    """Hold one of ``concurrency`` LLM call slots shared by all workers.
+
+    Waits for the shared next-start time first when ``rate_per_min`` is
+    set, then polls ``flock``-ed slot files until one is free. Without
+    ``fcntl`` the budget falls back to this process only.
+    """
+    if fcntl is None:
+        with _llm_fallback_lock:
+            if _llm_fallback['slots'] is None:
+                _llm_fallback['slots'] = threading.BoundedSemaphore(
+                    concurrency
+                )
+        _wait_for_rate(rate_per_min)
+        with _llm_fallback['slots']:
+            yield
+        return
+    os.makedirs(LLM_LOCK_DIR, exist_ok=True)
+    _wait_for_rate(rate_per_min)
+    fd = None
+    while fd is None:
+        for k in range(concurrency):
+            slot_fd = os.open(
+                os.path.join(LLM_LOCK_DIR, f'slot-{k}'),
+                os.O_RDWR | os.O_CREAT, 0o600
+            )
+            try:
+                fcntl.flock(slot_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(slot_fd)
+                continue
+            fd = slot_fd
+            break
+        else:
+            time.sleep(LLM_POLL_SECONDS)
+    try:
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
@@ -0,0 +1,364 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import content_index
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locks only
+    fcntl = None
+
+# Root under which every session / API key gets its own namespace
+WORKSPACE_ROOT = os.getenv('WORKSPACE_ROOT', '/tmp/byte_agents')
+# Lock files live outside the workspaces so users never see them
+LOCK_DIR = os.getenv('WORKSPACE_LOCK_DIR', '/tmp/byte_agents_locks')
+# Per-workspace disk quota
+QUOTA_BYTES = int(os.getenv('WORKSPACE_QUOTA_MB', '100')) * 1024 * 1024
+# Workspaces idle for longer than this are deleted. At the cap on their
+# number the least recently used idle one is evicted to make room, which
+# bounds total disk (and, on Cloud Run, memory) use without refusing
+# new users
+TTL_SECONDS = float(os.getenv('WORKSPACE_TTL_HOURS', '24')) * 3600
+MAX_WORKSPACES = int(os.getenv('WORKSPACE_MAX_COUNT', '50'))
+CLEANUP_INTERVAL = 300
+# In-progress uploads, kept beside (not inside) the workspaces so they
+# stay on the same filesystem without showing up in any listing
+STAGING_ROOT = os.path.join(WORKSPACE_ROOT, '.staging')
+
+COOKIE_NAME = 'workspace_id'
+API_KEY_HEADER = 'X-API-Key'
+_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+os.makedirs(WORKSPACE_ROOT, exist_ok=True)
+os.makedirs(LOCK_DIR, exist_ok=True)
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def session_workspace(req):
+    """Return (workspace_path, new_session_id) for a Flask request.
+
+    An API key maps to a stable namespace derived from its hash; otherwise
+    the ``workspace_id`` cookie is used, and a fresh id is minted (and
+    returned so the caller can set the cookie) when it is missing.
+    The directory itself is only created by the first write (see
+    ``locked``), so read-only requests leave nothing behind.
+    """
+    cleanup_expired()
+    new_id = None
+    api_key = req.headers.get(API_KEY_HEADER)
+    if api_key:
+        name = 'key-' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+    else:
+        sid = req.cookies.get(COOKIE_NAME, '')
+        if not _ID_RE.match(sid):
+            sid = new_id = uuid.uuid4().hex
+        name = 'session-' + sid
+    path = os.path.join(WORKSPACE_ROOT, name)
+    try:
+        # Directory mtime doubles as the last-activity time for the TTL
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return path, new_id
+
+
+def _workspace_dirs():
+    try:
+        names = os.listdir(WORKSPACE_ROOT)
+    except FileNotFoundError:
+        return []
+    return [
+        os.path.join(WORKSPACE_ROOT, n) for n in names
+        if not n.startswith('.')
+    ]
+
+
+def ensure_workspace(workspace):
+    """Create ``workspace`` on first write, enforcing the workspace cap."""
+    if os.path.isdir(workspace):
+        return
+    if len(_workspace_dirs()) >= MAX_WORKSPACES:
+        cleanup_expired(force=True)
+        while len(_workspace_dirs()) >= MAX_WORKSPACES:
+            if not _evict_lru():
+                raise QuotaExceeded(
+                    "Too many active workspaces, please try again later"
+                )
+    os.makedirs(workspace, exist_ok=True)
+
+
+def _remove_workspace(path):
+    shutil.rmtree(path)
+    content_index.drop_index(path)
+    shutil.rmtree(
+        os.path.join(STAGING_ROOT, os.path.basename(path)),
+        ignore_errors=True
+    )
+
+
+def _evict_lru():
+    """Remove the least recently used workspace that nobody is using.
+
+    Workspaces with an operation in flight (any lock held) are skipped.
+    Returns False when every workspace is busy.
+    """
+    by_age = []
+    for path in _workspace_dirs():
+        try:
+            by_age.append((os.stat(path).st_mtime, path))
+        except OSError:
+            pass
+    for _, path in sorted(by_age):
+        try:
+            with locked(path, writes=[path], create=False, blocking=False):
+                _remove_workspace(path)
+            return True
+        except OSError:
+            continue
+    return False
+
+
+def staging_dir(workspace):
+    """Per-workspace directory for uploads that are still arriving."""
+    path = os.path.join(STAGING_ROOT, os.path.basename(workspace))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+_cleanup_lock = threading.Lock()
+_last_cleanup = 0.0
+
+
+def cleanup_expired(force=False):
+    """Delete idle workspaces, stale uploads and unused lock files.
+
+    Runs at most every ``CLEANUP_INTERVAL`` seconds per process unless
+    ``force`` is set. Each workspace is removed under an exclusive lock on
+    its root, which every operation holds shared, so nothing in flight is
+    deleted.
+    """
+    global _last_cleanup
+    now = time.time()
+    with _cleanup_lock:
+        if not force and now - _last_cleanup < CLEANUP_INTERVAL:
+            return
+        _last_cleanup = now
+    for path in _workspace_dirs():
+        try:
+            if now - os.stat(path).st_mtime < TTL_SECONDS:
+                continue
+            with locked(path, writes=[path], create=False):
+                if now - os.stat(path).st_mtime < TTL_SECONDS:
+                    continue
+                _remove_workspace(path)
+        except OSError:
+            continue
+    _cleanup_lock_files()
+
+
+def _cleanup_lock_files():
+    if fcntl is None:
+        return
+    try:
+        names = os.listdir(LOCK_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        lock_path = os.path.join(LOCK_DIR, name)
+        try:
+            fd = os.open(lock_path, os.O_RDWR)
+        except OSError:
+            continue
+        try:
+            # Only files nobody holds or waits on can go; lockers re-check
+            # the inode after locking, so a concurrent open is safe
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.unlink(lock_path)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+def resolve(workspace, name):
+    """Join ``name`` onto ``workspace``, refusing paths that escape it."""
+    root = os.path.realpath(workspace)
+    path = os.path.realpath(os.path.join(root, name))
+    if path != root and not path.startswith(root + os.sep):
+        raise ValueError(f"Path escapes workspace: {name}")
+    return path
+
+
+def usage(workspace):
+    total = 0
+    for dirpath, _, filenames in os.walk(workspace):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def remaining_quota(workspace):
+    return QUOTA_BYTES - usage(workspace)
+
+
+def check_quota(workspace, extra=0):
+    used = usage(workspace)
+    if used + extra > QUOTA_BYTES:
+        raise QuotaExceeded(
+            f"Workspace quota exceeded ({used // 1024} KB used of "
+            f"{QUOTA_BYTES // 1024} KB)"
+        )
+
+
+class RWLock:
+    """Writer-preferring reader/writer lock for threads in one process."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire(self, write=False, blocking=True):
+        with self._cond:
+            if not blocking:
+                if self._writer or (
+                        self._readers if write else self._waiting_writers):
+                    return False
+                if write:
+                    self._writer = True
+                else:
+                    self._readers += 1
+                return True
+            if write:
+                self._waiting_writers += 1
+                while self._writer or self._readers:
+                    self._cond.wait()
+                self._waiting_writers -= 1
+                self._writer = True
+            else:
+                while self._writer or self._waiting_writers:
+                    self._cond.wait()
+                self._readers += 1
+            return True
+
+    def release(self, write=False):
+        with self._cond:
+            if write:
+                self._writer = False
+            else:
+                self._readers -= 1
+            self._cond.notify_all()
+
+
+_registry_lock = threading.Lock()
+_registry = {}  # path -> [RWLock, refcount]
+
+
+def _get_lock(path):
+    with _registry_lock:
+        entry = _registry.get(path)
+        if entry is None:
+            entry = _registry[path] = [RWLock(), 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def _put_lock(path):
+    with _registry_lock:
+        entry = _registry[path]
+        entry[1] -= 1
+        if not entry[1]:
+            del _registry[path]
+
+
+def _lock_plan(workspace, reads, writes):
+    """Map every path (and its ancestors) to a lock mode.
+
+    Targets get their requested mode and every parent directory up to the
+    workspace root gets a shared lock, so deleting a folder (or an expired
+    workspace) waits for operations on the files within it. Exclusive
+    wins when a path appears twice.
+    """
+    root = os.path.realpath(workspace)
+    plan = {}
+    for paths, write in ((reads, False), (writes, True)):
+        for path in paths:
+            path = os.path.realpath(path)
+            plan[path] = plan.get(path, False) or write
+            parent = os.path.dirname(path)
+            while parent == root or parent.startswith(root + os.sep):
+                plan.setdefault(parent, False)
+                parent = os.path.dirname(parent)
+    # A fixed global order prevents deadlocks between multi-path operations
+    return sorted(plan.items())
+
+
+def _flock(path, write, blocking=True):
+    """Open and flock the lock file for ``path``; return its descriptor.
+
+    Raises ``BlockingIOError`` if ``blocking`` is false and it is held.
+    """
+    digest = hashlib.sha1(path.encode('utf-8')).hexdigest()
+    lock_path = os.path.join(LOCK_DIR, digest + '.lock')
+    flags = fcntl.LOCK_EX if write else fcntl.LOCK_SH
+    if not blocking:
+        flags |= fcntl.LOCK_NB
+    while True:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, flags)
+            # The cleanup may have unlinked the file while we waited
+            if os.fstat(fd).st_ino == os.stat(lock_path).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        except BaseException:
+            os.close(fd)
+            raise
+        os.close(fd)
+
+
+@contextmanager
+def locked(workspace, reads=(), writes=(), create=True, blocking=True):
+    """Hold shared locks on ``reads`` and exclusive locks on ``writes``.
+
+    Locks are taken in-process first, then with ``fcntl.flock`` on a lock
+    file so that other gunicorn workers are excluded as well. Once the
+    locks are held, the workspace is created if this is its first write.
+    With ``blocking=False``, ``BlockingIOError`` is raised instead of
+    waiting for a lock that is held.
+    """
+    held = []
+    try:
+        for path, write in _lock_plan(workspace, reads, writes):
+            rw = _get_lock(path)
+            if not rw.acquire(write, blocking):
+                _put_lock(path)
+                raise BlockingIOError(f"Lock is busy: {path}")
+            entry = [path, write, rw, None]
+            held.append(entry)
+            if fcntl is not None:
+                entry[3] = _flock(path, write, blocking)
+        if writes and create:
+            ensure_workspace(workspace)
+        yield
+    finally:
+        for path, write, rw, fd in reversed(held):
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+            rw.release(write)
+            _put_lock(path)